@@ -1,6 +1,25 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 import io
+import re
+import hashlib
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.compute as pc
+import zipfile
+from xml.sax.saxutils import escape
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.utils import get_column_letter
+from openpyxl.styles import Font, Alignment
+
+from rapidfuzz import process as fuzz_process, fuzz
+
+try:
+    import polars as pl
+except ImportError:
+    pl = None
 
 # ==========================================
 # TEXT CONFIGURATION
@@ -62,9 +81,14 @@ st.set_page_config(
 )
 
 # --- LOAD EXTERNAL CSS ---
-def local_css(file_name):
+# Read once per process; every rerun just re-sends the cached string
+@st.cache_data(show_spinner=False)
+def load_css(file_name):
     with open(file_name) as f:
-        st.markdown(f'<style>{f.read()}</style>', unsafe_allow_html=True)
+        return f.read()
+
+def local_css(file_name):
+    st.markdown(f'<style>{load_css(file_name)}</style>', unsafe_allow_html=True)
 
 try:
     local_css("style.css")
@@ -73,6 +97,12 @@ except FileNotFoundError:
 
 # Constants
 INCLUDE_PAYMENT_STATUSES = ['paid', 'partially_paid']
+# Caches holding upload data (and customer emails) are bounded so files don't outlive the visit in server memory
+UPLOAD_CACHE_TTL = 3600  # seconds
+# Columns only ever used as text; read/cast them as strings instead of letting the parser infer a type
+TEXT_COLS = ('sku', 'product_title', 'variant_title', 'canceled', 'financial_status')
+# Key columns read as text too: numeric IDs with blanks (guest checkouts) would otherwise infer to int/float
+ID_COLS = ('order_id', 'customer_id', 'email')
 COL_CANDIDATES = {
     'order_id': ['order id', 'name', 'order', 'order number', 'order_id'],
     'customer_id': ['customer id', 'customer_id', 'customer'],
@@ -91,94 +121,423 @@ COL_CANDIDATES = {
 def normalize_header(h):
     return str(h).lower().replace('_', ' ').replace('-', ' ').strip()
 
-def find_column(df_cols, candidates):
-    for c in candidates:
-        if c in df_cols: return c
-    lower_cols = {col.lower(): col for col in df_cols}
-    for c in candidates:
-        if c.lower() in lower_cols: return lower_cols[c.lower()]
-    norm_cols = {normalize_header(col): col for col in df_cols}
+# COL_CANDIDATES never changes, so normalize it once per process instead of on every upload
+@st.cache_resource(show_spinner=False)
+def normalized_candidates():
+    return {key: [normalize_header(c) for c in cands] for key, cands in COL_CANDIDATES.items()}
+
+def find_column(norm_cols, candidates):
+    # norm_cols: {normalize_header(col): col}, built once per file by the caller; candidates are pre-normalized
     for cand in candidates:
-        norm_cand = normalize_header(cand)
-        for norm_col, original_col in norm_cols.items():
-            if norm_cand == norm_col: return original_col
+        hit = norm_cols.get(cand)
+        if hit is not None: return hit
     return None
 
-def parse_money(val):
-    if pd.isna(val): return 0.0
-    s = str(val).replace(',', '').replace('$', '').strip()
-    if '(' in s and ')' in s: s = '-' + s.replace('(', '').replace(')', '')
-    try: return float(s)
-    except: return 0.0
+def parse_money_series(values):
+    if pd.api.types.is_numeric_dtype(values): return values.astype(float).fillna(0.0)
+    s = values.astype('string').str.replace(r'[,$]', '', regex=True).str.strip()
+    # Accounting negatives: (12.50) -> -12.50
+    s = s.str.replace(r'^\((.*)\)$', r'-\1', regex=True)
+    return pd.to_numeric(s, errors='coerce').astype(float).fillna(0.0)
+
+def parse_dates(values):
+    # Exports use ISO 8601: a fixed format skips per-value inference and cache=True parses repeats once.
+    # Fall back to inference if that loses values (e.g. '08/24/2024').
+    parsed = pd.to_datetime(values, utc=True, errors='coerce', format='ISO8601', cache=True)
+    if parsed.isna().sum() > values.isna().sum():
+        parsed = pd.to_datetime(values, utc=True, errors='coerce', cache=True)
+    return parsed
+
+def casefold_hits(values, targets, fold=str.lower):
+    # Status/SKU columns repeat a limited set of values: case-fold those instead of every row.
+    # Returns the raw values that match, and whether that is every value (no NAs, nothing else).
+    uniq = values.unique()
+    hits = [u for u in uniq if not pd.isna(u) and fold(str(u)) in targets]
+    return hits, len(hits) == len(uniq)
 
 # --- EXCEL GENERATOR ---
-def convert_to_excel(df, report_type):
+# Report styles, built once instead of on every download
+_BOLD_FONT = Font(bold=True, name='Arial', size=11)
+_REGULAR_FONT = Font(name='Arial', size=10)
+_PURPLE_LINK_FONT = Font(name='Arial', size=10, color="7030A0", underline="single")
+_HEADER_FONT = Font(bold=True, name='Arial', size=14)
+_TEXT_ALIGN = Alignment(wrap_text=True, vertical='top')
+
+# Side panel in column J: (row, title, text, link) — title in `row`, text right below it
+_SIDE_TITLE = "Systematik data — Product mix report"
+_SIDE_BLOCKS = [
+    (4, "1. What this report shows", 
+     "This table groups your historical orders to reveal unique product combinations. It tells you exactly which items are purchased together and how much revenue those specific combinations generate.", None),
+    (8, "2. Actionable strategies", 
+     "**• Create 'Power Bundles':** If specific items (e.g., 'Shampoo + Conditioner') are bought together frequently, create a one-click bundle with a slight discount to increase AOV.\n"
+     "**• Smart email flows:** If a customer buys 'Item A' but not 'Item B' (and your data shows they usually go together), trigger a specific cross-sell email flow 3 days later.\n"
+     "**• Inventory planning:** Use high-volume mixes to predict demand. If you run a promo on 'Item A', ensure you have enough stock of its pair, 'Item B'.", None),
+    (16, "3. Go deeper (advanced analytics)", 
+     "Want to know which customers are worth the most? Try calculating LTV (Lifetime Value) by First Order Mix. You might find that customers who start with 'Bundle X' are worth 3x more than those who start with 'Product Y'.", None),
+    (20, "4. Tired of manual exports?", 
+     "This report is a snapshot in time. We can build you a live, automated dashboard that refreshes this data daily, letting you track bundle performance in real-time without spreadsheets.", None),
+    (23, "Powered by Systematik", "Full-stack data agency for ecommerce brands ($5M-$100M).", None),
+    (26, "Visit our website", "systematikdata.com", "https://go.systematikdata.com/Ucel5B"),
+]
+
+# Reports above this many rows skip openpyxl and stream the sheet XML directly
+FAST_XLSX_ROWS = 20_000
+
+# --- RAW XLSX WRITER (large reports) ---
+_XLSX_NS = 'xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships"'
+_XLSX_REL = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+_XLSX_PARTS = {
+    '[Content_Types].xml': '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '<Override PartName="/xl/styles.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/></Types>',
+    '_rels/.rels': '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        f'<Relationship Id="rId1" Type="{_XLSX_REL}/officeDocument" Target="xl/workbook.xml"/></Relationships>',
+    'xl/workbook.xml': f'<workbook {_XLSX_NS}><sheets><sheet name="Report" sheetId="1" r:id="rId1"/></sheets></workbook>',
+    'xl/_rels/workbook.xml.rels': '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        f'<Relationship Id="rId1" Type="{_XLSX_REL}/worksheet" Target="worksheets/sheet1.xml"/>'
+        f'<Relationship Id="rId2" Type="{_XLSX_REL}/styles" Target="styles.xml"/></Relationships>',
+    # cellXfs: 0 default, 1 datetime, 2 bold title, 3 regular, 4 regular wrapped, 5 link wrapped, 6 report header
+    'xl/styles.xml': '<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+        '<numFmts count="1"><numFmt numFmtId="164" formatCode="yyyy-mm-dd h:mm:ss"/></numFmts>'
+        '<fonts count="5"><font><sz val="11"/><name val="Calibri"/></font>'
+        '<font><b/><sz val="11"/><name val="Arial"/></font>'
+        '<font><sz val="10"/><name val="Arial"/></font>'
+        '<font><u/><sz val="10"/><color rgb="007030A0"/><name val="Arial"/></font>'
+        '<font><b/><sz val="14"/><name val="Arial"/></font></fonts>'
+        '<fills count="2"><fill><patternFill patternType="none"/></fill><fill><patternFill patternType="gray125"/></fill></fills>'
+        '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+        '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+        '<cellXfs count="7"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+        '<xf numFmtId="164" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>'
+        '<xf numFmtId="0" fontId="1" fillId="0" borderId="0" xfId="0" applyFont="1"/>'
+        '<xf numFmtId="0" fontId="2" fillId="0" borderId="0" xfId="0" applyFont="1"/>'
+        '<xf numFmtId="0" fontId="2" fillId="0" borderId="0" xfId="0" applyFont="1" applyAlignment="1"><alignment vertical="top" wrapText="1"/></xf>'
+        '<xf numFmtId="0" fontId="3" fillId="0" borderId="0" xfId="0" applyFont="1" applyAlignment="1"><alignment vertical="top" wrapText="1"/></xf>'
+        '<xf numFmtId="0" fontId="4" fillId="0" borderId="0" xfId="0" applyFont="1"/></cellXfs>'
+        '<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles></styleSheet>',
+}
+_XML_ILLEGAL = re.compile(r'[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+def _xlsx_text(letter, row, value, style=0):
+    text = escape(_XML_ILLEGAL.sub('', str(value)))
+    s = f' s="{style}"' if style else ''
+    return f'<c r="{letter}{row}" t="inlineStr"{s}><is><t xml:space="preserve">{text}</t></is></c>'
+
+def _xlsx_column(letter, values):
+    # One <c> per data row (rows 2..n+1), '' for blanks — a single Python pass per column, no cell objects
+    rows = range(2, len(values) + 2)
+    # Categoricals (e.g. First order ID) are typed by their categories, as openpyxl writes the decoded values
+    if isinstance(values.dtype, pd.CategoricalDtype): values = values.astype(values.cat.categories.dtype)
+    if pd.api.types.is_datetime64_any_dtype(values):
+        serial = ((values - pd.Timestamp('1899-12-30')) / pd.Timedelta(days=1)).tolist()
+        return ['' if pd.isna(v) else f'<c r="{letter}{r}" s="1"><v>{v!r}</v></c>' for r, v in zip(rows, serial)]
+    if pd.api.types.is_integer_dtype(values) and not values.hasnans:
+        return [f'<c r="{letter}{r}"><v>{v}</v></c>' for r, v in zip(rows, values.tolist())]
+    if pd.api.types.is_numeric_dtype(values) and not pd.api.types.is_bool_dtype(values):
+        nums = values.astype(float).tolist()
+        return ['' if not np.isfinite(v) else f'<c r="{letter}{r}"><v>{v:.16g}</v></c>' for r, v in zip(rows, nums)]
+    return ['' if pd.isna(v) else _xlsx_text(letter, r, v) for r, v in zip(rows, values.astype(object).tolist())]
+
+def _fast_xlsx(df_export, subtitle):
+    side = {1: (6, _SIDE_TITLE), 2: (3, subtitle)}
+    links = []
+    for row, title, text, link in _SIDE_BLOCKS:
+        side[row] = (2, title)
+        side[row + 1] = (5 if link else 4, text)
+        if link: links.append((f'J{row + 1}', link))
+
+    letters = [get_column_letter(i + 1) for i in range(len(df_export.columns))]
+    cells = [_xlsx_column(l, df_export[c]) for l, c in zip(letters, df_export.columns)]
+    header = ''.join(_xlsx_text(l, 1, c) for l, c in zip(letters, df_export.columns))
+
+    output = io.BytesIO()
+    with zipfile.ZipFile(output, 'w', zipfile.ZIP_DEFLATED) as zf:
+        for name, xml in _XLSX_PARTS.items(): zf.writestr(name, '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n' + xml)
+        if links:
+            zf.writestr('xl/worksheets/_rels/sheet1.xml.rels', '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+                        + ''.join(f'<Relationship Id="rId{i}" Type="{_XLSX_REL}/hyperlink" Target="{escape(url)}" TargetMode="External"/>'
+                                  for i, (_, url) in enumerate(links, 1)) + '</Relationships>')
+        with zf.open('xl/worksheets/sheet1.xml', 'w') as f:
+            f.write(f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n<worksheet {_XLSX_NS}>'
+                    '<cols><col min="1" max="5" width="20" customWidth="1"/><col min="6" max="9" width="5" customWidth="1"/>'
+                    '<col min="10" max="10" width="70" customWidth="1"/></cols><sheetData>'.encode())
+            buf = []
+            for r in range(1, max(len(df_export) + 1, max(side)) + 1):
+                row = header if r == 1 else ''.join(col[r - 2] for col in cells) if r <= len(df_export) + 1 else ''
+                if r in side: row += _xlsx_text('J', r, side[r][1], side[r][0])
+                buf.append(f'<row r="{r}">{row}</row>')
+                if len(buf) >= 10_000: f.write(''.join(buf).encode()); buf = []
+            f.write(''.join(buf).encode())
+            hyperlinks = ''.join(f'<hyperlink ref="{ref}" r:id="rId{i}"/>' for i, (ref, _) in enumerate(links, 1))
+            f.write(f'</sheetData>{f"<hyperlinks>{hyperlinks}</hyperlinks>" if links else ""}</worksheet>'.encode())
+    return output.getvalue()
+
+# Cached: the download buttons are rebuilt on every rerun, but the workbook only changes with the data.
+# Keyed on what determines the report (upload digest, sidebar settings, report type, date), not on the frame:
+# Streamlit hashes big frames from a row sample, so an edited row could serve stale bytes. `_df` isn't hashed.
+@st.cache_data(show_spinner=False, max_entries=16, ttl=UPLOAD_CACHE_TTL)
+def convert_to_excel(file_key, settings, report_type, report_date, _df):
     output = io.BytesIO()
     
     # Remove Timezone info from any datetime columns
-    df_export = df.copy()
+    df_export = _df.copy()
     for col in df_export.columns:
         if pd.api.types.is_datetime64_any_dtype(df_export[col]):
             df_export[col] = df_export[col].dt.tz_localize(None)
 
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        # Write df starting at Row 1 (Index 0)
-        df_export.to_excel(writer, index=False, startrow=0, sheet_name='Report')
-        
-        workbook = writer.book
-        worksheet = writer.sheets['Report']
-        
-        from openpyxl.styles import Font, Alignment
-        
-        bold_font = Font(bold=True, name='Arial', size=11)
-        regular_font = Font(name='Arial', size=10)
-        purple_link_font = Font(name='Arial', size=10, color="7030A0", underline="single")
-        header_font = Font(bold=True, name='Arial', size=14)
-        text_align = Alignment(wrap_text=True, vertical='top')
-        
-        def write_side_block(row, title, text, link=None):
-            cell_title = worksheet[f'J{row}']
-            cell_title.value = title
-            cell_title.font = bold_font
-            
-            cell_text = worksheet[f'J{row+1}']
-            cell_text.value = text
-            cell_text.font = regular_font if not link else purple_link_font
-            cell_text.alignment = text_align
-            if link: cell_text.hyperlink = link
-
-        # --- WRITE CONTENT (Column J) ---
-        worksheet['J1'] = "Systematik data — Product mix report"
-        worksheet['J1'].font = header_font
-        
-        worksheet['J2'] = f"Report: {report_type} | Date: {pd.Timestamp.now().strftime('%Y-%m-%d')}"
-        worksheet['J2'].font = regular_font
+    subtitle = f"Report: {report_type} | Date: {report_date}"
+    if len(df_export) > FAST_XLSX_ROWS: return _fast_xlsx(df_export, subtitle)
+
+    # Write-only workbook: rows stream straight to the file instead of building every cell in memory.
+    # It can't seek back to column J, so the side panel is appended row by row alongside the data.
+    workbook = Workbook(write_only=True)
+    worksheet = workbook.create_sheet('Report')
+
+    def styled(value, font, alignment=None, link=None):
+        cell = WriteOnlyCell(worksheet, value=value)
+        cell.font = font
+        if alignment: cell.alignment = alignment
+        if link: cell.hyperlink = link
+        return cell
+
+    # --- SIDE CONTENT (Column J), keyed by sheet row ---
+    side = {1: styled(_SIDE_TITLE, _HEADER_FONT), 2: styled(subtitle, _REGULAR_FONT)}
+    for row, title, text, link in _SIDE_BLOCKS:
+        side[row] = styled(title, _BOLD_FONT)
+        side[row + 1] = styled(text, _REGULAR_FONT if not link else _PURPLE_LINK_FONT, _TEXT_ALIGN, link)
+
+    # Layout Adjustments (write-only sheets need these before the first row)
+    worksheet.column_dimensions['J'].width = 70
+    for col in ['F', 'G', 'H', 'I']: worksheet.column_dimensions[col].width = 5
+    for col in ['A', 'B', 'C', 'D', 'E']: worksheet.column_dimensions[col].width = 20
+
+    # --- WRITE ROWS: header, data (blank cells for NaN/NaT), side panel in column J ---
+    header = list(df_export.columns)
+    data = df_export.astype(object).where(df_export.notna(), None).itertuples(index=False, name=None)
+    for r in range(1, max(len(df_export) + 1, max(side)) + 1):
+        row = header if r == 1 else list(next(data, ()))
+        if r in side: row = row + [None] * (9 - len(row)) + [side[r]]
+        worksheet.append(row)
+
+    workbook.save(output)
 
-        write_side_block(4, "1. What this report shows", 
-                         "This table groups your historical orders to reveal unique product combinations. It tells you exactly which items are purchased together and how much revenue those specific combinations generate.")
-        
-        write_side_block(8, "2. Actionable strategies", 
-                         "**• Create 'Power Bundles':** If specific items (e.g., 'Shampoo + Conditioner') are bought together frequently, create a one-click bundle with a slight discount to increase AOV.\n"
-                         "**• Smart email flows:** If a customer buys 'Item A' but not 'Item B' (and your data shows they usually go together), trigger a specific cross-sell email flow 3 days later.\n"
-                         "**• Inventory planning:** Use high-volume mixes to predict demand. If you run a promo on 'Item A', ensure you have enough stock of its pair, 'Item B'.")
-        
-        write_side_block(16, "3. Go deeper (advanced analytics)", 
-                         "Want to know which customers are worth the most? Try calculating LTV (Lifetime Value) by First Order Mix. You might find that customers who start with 'Bundle X' are worth 3x more than those who start with 'Product Y'.")
-        
-        write_side_block(20, "4. Tired of manual exports?", 
-                         "This report is a snapshot in time. We can build you a live, automated dashboard that refreshes this data daily, letting you track bundle performance in real-time without spreadsheets.")
-        
-        write_side_block(23, "Powered by Systematik", 
-                         "Full-stack data agency for ecommerce brands ($5M-$100M).")
-        
-        write_side_block(26, "Visit our website", "systematikdata.com", link="https://go.systematikdata.com/Ucel5B")
+    return output.getvalue()
+
+# --- ORDER AGGREGATION ---
+# One row per order: product_mix, net_sales, final_cust_id, date. Runs in polars when it's installed.
+def aggregate_orders(df):
+    if pl is not None:
+        # Hand polars the integer category codes; -1 marks a missing order ID (pandas drops those groups)
+        narrow = pd.DataFrame({
+            'order_id': df['order_id'].cat.codes,
+            'identifier': df['identifier'].astype('string[pyarrow]'),
+            'net_sales': df['net_sales'],
+            'final_cust_id': df['final_cust_id'].cat.codes,
+            'date': df['date']
+        })
+        out = (pl.from_pandas(narrow).lazy()
+               .filter(pl.col('order_id') >= 0)
+               .group_by('order_id', maintain_order=True)
+               .agg(pl.col('net_sales').sum(),
+                    pl.col('final_cust_id').first(),
+                    pl.col('date').min(),
+                    pl.col('identifier').unique().sort().str.join(' + ').alias('product_mix'))
+               .collect()
+               .to_pandas())
+        out['order_id'] = pd.Categorical.from_codes(out['order_id'], df['order_id'].cat.categories)
+        out['final_cust_id'] = pd.Categorical.from_codes(out['final_cust_id'], df['final_cust_id'].cat.categories)
+        return out
+
+    # Sort (order, identifier) category codes once and drop repeats by comparing neighbours; code -1 (missing
+    # order ID) forms no group, as in pandas. Categories are sorted, so code order is identifier order.
+    o, i = df['order_id'].cat.codes.to_numpy(), df['identifier'].cat.codes.to_numpy()
+    idx = np.lexsort((i, o))
+    o, i = o[idx], i[idx]
+    keep = o >= 0
+    keep[1:] &= (o[1:] != o[:-1]) | (i[1:] != i[:-1])
+    o, i = o[keep], i[keep]
+    # Each order's run becomes one Arrow list, joined in a single binary_join call (no Python call per order)
+    starts = np.flatnonzero(np.diff(o, prepend=-2))
+    names = pa.array(df['identifier'].cat.categories.to_numpy(dtype=object), type=pa.string()).take(pa.array(i))
+    mixes = pc.binary_join(pa.ListArray.from_arrays(pa.array(np.append(starts, len(o)).astype(np.int32)), names), ' + ')
+    mix_by_code = np.empty(len(df['order_id'].cat.categories), dtype=object)
+    mix_by_code[o[starts]] = mixes.to_numpy(zero_copy_only=False)
+
+    order_groups = df.groupby('order_id', sort=False, observed=True).agg(
+        net_sales=('net_sales', 'sum'),
+        final_cust_id=('final_cust_id', 'first'),
+        date=('date', 'min')
+    )
+    order_groups['product_mix'] = mix_by_code[order_groups.index.codes]
+    return order_groups.reset_index()
+
+# --- ANALYSIS PIPELINE ---
+# Cached on file hash + settings so widget reruns skip the work (Streamlit doesn't hash `_file_bytes`)
+@st.cache_data(show_spinner=False, max_entries=4, ttl=UPLOAD_CACHE_TTL)
+def load_df(file_key, _file_bytes, file_name, usecols=None, text_cols=()):
+    if file_name.endswith('.csv'):
+        # pyarrow's multithreaded reader is much faster on big exports; fall back to the C engine.
+        # text_cols are read as text up front, so e.g. numeric SKUs stay "104" instead of inferring to 104.0,
+        # and numeric customer IDs with blanks stay strings that can be coalesced with emails
+        usecols = list(usecols) if usecols else None
+        try:
+            convert = pa_csv.ConvertOptions(include_columns=usecols, column_types={c: pa.string() for c in text_cols},
+                                            strings_can_be_null=True)
+            return pa_csv.read_csv(io.BytesIO(_file_bytes), convert_options=convert).to_pandas(types_mapper=pd.ArrowDtype)
+        except Exception:
+            return pd.read_csv(io.BytesIO(_file_bytes), engine='c', low_memory=False, cache_dates=True, usecols=usecols,
+                               dtype={c: str for c in text_cols})
+    # calamine (Rust) streams the sheet instead of building openpyxl's full workbook model
+    try: return pd.read_excel(io.BytesIO(_file_bytes), engine='calamine')
+    except ImportError: return pd.read_excel(io.BytesIO(_file_bytes), engine='openpyxl')
+
+def map_columns(columns):
+    norm_cols = {normalize_header(c): c for c in columns}
+    col_map = {}
+    for key, candidates in normalized_candidates().items():
+        found = find_column(norm_cols, candidates)
+        if found: col_map[key] = found
+    # Typo'd headers ("finantial status") get a strict fuzzy match, only against headers nothing matched exactly.
+    # A trailing "s" is not a typo: "Customers" or "Dates" is usually a count/summary column, not the field itself.
+    free = [h for h, c in norm_cols.items() if c not in col_map.values()]
+    for key, candidates in normalized_candidates().items():
+        if key in col_map or not free: continue
+        hits = []
+        for cand in candidates:
+            choices = [h for h in free if h != cand + 's' and h + 's' != cand]
+            hit = fuzz_process.extractOne(cand, choices, scorer=fuzz.ratio, score_cutoff=88)
+            if hit: hits.append(hit)
+        if not hits: continue
+        best = max(hits, key=lambda h: h[1])[0]
+        col_map[key] = norm_cols[best]
+        free.remove(best)
+    return col_map
+
+# Clean + filter raw line items down to (order_id, identifier, net_sales, final_cust_id, date)
+def prepare_line_items(df, col_map, id_mode, use_quantity, ignore_skus, ignore_titles, ignore_vars):
+    # Keep only the mapped columns; exports often carry dozens more that would ride through every step
+    df = df[list(col_map.values())]
+    df = df.rename(columns={v: k for k, v in col_map.items()})
+    
+    # Cast the text columns to Arrow-backed strings once; every .str op below reuses them
+    text_cols = [c for c in TEXT_COLS if c in df.columns]
+    if text_cols: df[text_cols] = df[text_cols].astype('string[pyarrow]')
 
-        # Layout Adjustments
-        worksheet.column_dimensions['J'].width = 70
-        for col in ['F', 'G', 'H', 'I']: worksheet.column_dimensions[col].width = 5
-        for col in ['A', 'B', 'C', 'D', 'E']: worksheet.column_dimensions[col].width = 20
+    if 'net_sales' in df.columns: df['net_sales'] = parse_money_series(df['net_sales'])
+    else: df['net_sales'] = 0.0
+    
+    if 'quantity' in df.columns: 
+        df['quantity'] = pd.to_numeric(df['quantity'], errors='coerce').astype(float).fillna(1).astype(int)
+    else: df['quantity'] = 1
+
+    # Build identifiers column-wise instead of a per-row apply
+    def text_col(name):
+        if name not in df.columns: return pd.Series('', index=df.index)
+        return df[name].fillna('').str.strip()
+
+    p, v, s = text_col('product_title'), text_col('variant_title'), text_col('sku')
+    if id_mode == 'SKU': base_id = s.where(s != '', p)
+    elif id_mode == 'Product + Variant': base_id = np.where(v != '', p + ' (' + v + ')', p)
+    else: base_id = p
+    if use_quantity:
+        base_id = np.where(df['quantity'] > 1, df['quantity'].astype(str) + 'x ' + base_id, base_id)
+    df['identifier'] = base_id
+
+    # Combine every row filter into one mask and slice the frame once
+    keep = df['identifier'] != ''
+    if 'canceled' in df.columns:
+        canceled, _ = casefold_hits(df['canceled'], ('true', 'yes', '1', 't', 'y'))
+        if canceled: keep &= ~df['canceled'].isin(canceled)
+    if 'financial_status' in df.columns and INCLUDE_PAYMENT_STATUSES:
+        paid, all_paid = casefold_hits(df['financial_status'], INCLUDE_PAYMENT_STATUSES)
+        # Exports pre-filtered to paid orders skip the row pass entirely
+        if not all_paid: keep &= df['financial_status'].isin(paid)
+    if 'sku' in df.columns and ignore_skus:
+        skus, _ = casefold_hits(df['sku'], ignore_skus, fold=str.upper)
+        if skus: keep &= ~df['sku'].isin(skus)
+    # One escaped alternation per filter = one scan, and entries like "T-Shirt (Sample)" match literally
+    if 'product_title' in df.columns and (ignore_titles or ignore_vars):
+        title_lower = df['product_title'].str.lower()
+        if ignore_titles:
+            keep &= ~title_lower.str.contains('|'.join(map(re.escape, ignore_titles)), regex=True, na=False)
+        if ignore_vars:
+            v_lower = df['variant_title'].str.lower() if 'variant_title' in df.columns else pd.Series("", index=df.index)
+            # One str.cat join instead of chained '+' temporaries; nulls still propagate (and never match)
+            combo_check = title_lower.str.cat(v_lower, sep=" (") + ")"
+            keep &= ~combo_check.str.contains('|'.join(map(re.escape, ignore_vars)), regex=True, na=False)
+    df = df.loc[keep].copy()
+
+    # customer ID -> email -> '(unknown)', using only the columns that exist (no placeholder columns).
+    # Cast to string first: numeric IDs (e.g. Excel floats) can't be filled with emails in place
+    cust = pd.Series('(unknown)', index=df.index)
+    for c in ('email', 'customer_id'):
+        if c in df.columns: cust = df[c].astype('string').fillna(cust)
+    df['final_cust_id'] = cust
+
+    return df[[c for c in ('order_id', 'identifier', 'net_sales', 'final_cust_id', 'date') if c in df.columns]]
+
+@st.cache_data(show_spinner=False, max_entries=16, ttl=UPLOAD_CACHE_TTL)
+def analyze(file_key, _file_bytes, file_name, id_mode, use_quantity, ignore_skus, ignore_titles, ignore_vars):
+    filters = (id_mode, use_quantity, ignore_skus, ignore_titles, ignore_vars)
+    if file_name.endswith('.csv'):
+        # Map columns from the header alone, then parse only the mapped columns
+        col_map = map_columns(pd.read_csv(io.BytesIO(_file_bytes), nrows=0).columns)
+        if 'order_id' not in col_map: return None
+        usecols = tuple(dict.fromkeys(col_map.values()))
+        # IDs are read as text so numeric IDs with blanks keep their exact values
+        text_cols = tuple(dict.fromkeys(col_map[k] for k in ID_COLS + TEXT_COLS if k in col_map))
+        df = prepare_line_items(load_df(file_key, _file_bytes, file_name, usecols, text_cols), col_map, *filters)
+    else:
+        df = load_df(file_key, _file_bytes, file_name)
+        col_map = map_columns(df.columns)
+        if 'order_id' not in col_map: return None
+        df = prepare_line_items(df, col_map, *filters)
+
+    # --- DATE LOGIC FOR FILENAME ---
+    try:
+        if 'date' in df.columns: 
+            df['date'] = parse_dates(df['date'])
+            min_date = df['date'].min().strftime('%Y-%m-%d')
+            max_date = df['date'].max().strftime('%Y-%m-%d')
+            filename_suffix = f"{min_date} to {max_date}"
+        else:
+            filename_suffix = "analysis"
+    except:
+        filename_suffix = "analysis"
+
+    # Category codes make the grouping keys cheap ints instead of hashed strings
+    for c in ('order_id', 'final_cust_id', 'identifier'): df[c] = df[c].astype('category')
+
+    order_groups = aggregate_orders(df)
+    # Blank identifiers are dropped at row level, so every order already has a non-empty mix.
+    # product_mix as category: the mix roll-up below groups on int codes
+    order_groups['product_mix'] = order_groups['product_mix'].astype('category')
+
+    # Totals come straight from the order table (one row per order), not from re-summing mix_df
+    total_orders = len(order_groups)
+    total_net = order_groups['net_sales'].sum()
+
+    mix_df = order_groups.groupby('product_mix', sort=False, observed=True).agg({'order_id': 'count', 'net_sales': 'sum'}).reset_index()
+    mix_df.columns = ['Product mix', 'Orders', 'Net sales']
+    mix_df = mix_df.assign(**{
+        '% of total': mix_df['Orders'] / total_orders,
+        '% of net sales': mix_df['Net sales'] / total_net
+    })
+    mix_df = mix_df[['Product mix', 'Orders', '% of total', 'Net sales', '% of net sales']]
+    mix_df = mix_df.sort_values('Orders', ascending=False)
+    
+    # Earliest order per customer via a grouped idxmin (one pass) instead of sorting every order;
+    # undated orders rank last, as they did in the sort. Only the per-customer result is sorted for display.
+    rank_date = order_groups['date'].fillna(pd.Timestamp.max.tz_localize('UTC'))
+    first_idx = rank_date.groupby(order_groups['final_cust_id'], sort=False, observed=True).idxmin()
+    first_orders = order_groups.loc[first_idx].sort_values('date')
+    first_orders_out = first_orders[['final_cust_id', 'order_id', 'date', 'product_mix']].copy()
+    first_orders_out.columns = ['Customer ID', 'First order ID', 'First order date', 'First order product mix']
 
-    return output.getvalue()
+    return mix_df, first_orders_out, total_orders, total_net, filename_suffix
 
 # --- SIDEBAR ---
 with st.sidebar:
@@ -283,103 +642,22 @@ uploaded_file = st.file_uploader("Drag & drop CSV or Excel file here", type=['cs
 if uploaded_file:
     with st.spinner("Analyzing data..."):
         try:
-            if uploaded_file.name.endswith('.csv'): df = pd.read_csv(uploaded_file)
-            else: df = pd.read_excel(uploaded_file)
-            
-            col_map = {}
-            for key, candidates in COL_CANDIDATES.items():
-                found = find_column(df.columns, candidates)
-                if found: col_map[key] = found
-            
-            if 'order_id' not in col_map:
+            file_bytes = uploaded_file.getvalue()
+            file_key = hashlib.blake2b(file_bytes, digest_size=16).hexdigest()
+            settings = (id_mode, use_quantity, tuple(sorted(ignore_skus)), tuple(ignore_titles), tuple(ignore_vars))
+
+            # Same file + same settings as the last run: reuse this session's result as-is
+            # (skips even the cache_data copy, and survives cache eviction)
+            last = st.session_state.get('analysis')
+            if last and last[0] == (file_key, settings):
+                result = last[1]
+            else:
+                result = analyze(file_key, file_bytes, uploaded_file.name, *settings)
+                st.session_state['analysis'] = ((file_key, settings), result)
+            if result is None:
                 st.error(APP_CONFIG["error_msg"])
                 st.stop()
-
-            df = df.rename(columns={v: k for k, v in col_map.items() if k in col_map})
-            
-            if 'canceled' in df.columns:
-                df['canceled_norm'] = df['canceled'].astype(str).str.lower()
-                df = df[~df['canceled_norm'].isin(['true', 'yes', '1', 't', 'y'])]
-            if 'financial_status' in df.columns:
-                df['financial_status'] = df['financial_status'].astype(str).str.lower()
-                if INCLUDE_PAYMENT_STATUSES: df = df[df['financial_status'].isin(INCLUDE_PAYMENT_STATUSES)]
-
-            if 'net_sales' in df.columns: df['net_sales'] = df['net_sales'].apply(parse_money)
-            else: df['net_sales'] = 0.0
-            
-            if 'quantity' in df.columns: 
-                df['quantity'] = pd.to_numeric(df['quantity'], errors='coerce').fillna(1).astype(int)
-            else: df['quantity'] = 1
-
-            if 'sku' in df.columns and ignore_skus: df = df[~df['sku'].astype(str).str.upper().isin(ignore_skus)]
-            if 'product_title' in df.columns and ignore_titles:
-                for ignore_str in ignore_titles: df = df[~df['product_title'].astype(str).str.lower().str.contains(ignore_str, na=False)]
-            if 'product_title' in df.columns and ignore_vars:
-                p_titles = df['product_title'].astype(str)
-                v_titles = df['variant_title'].astype(str) if 'variant_title' in df.columns else pd.Series([""] * len(df))
-                combo_check = p_titles + " (" + v_titles + ")"
-                for ignore_str in ignore_vars: df = df[~combo_check.str.lower().str.contains(ignore_str, na=False)]
-
-            def get_identifier(row):
-                p = str(row.get('product_title', '')).strip()
-                v = str(row.get('variant_title', '')).strip()
-                s = str(row.get('sku', '')).strip()
-                if p == 'nan': p = ''
-                if v == 'nan': v = ''
-                if s == 'nan': s = ''
-                base_id = p
-                if id_mode == 'SKU': base_id = s if s else p
-                elif id_mode == 'Product + Variant': base_id = f"{p} ({v})" if v else p
-                if use_quantity and row['quantity'] > 1: return f"{row['quantity']}x {base_id}"
-                return base_id
-
-            df['identifier'] = df.apply(get_identifier, axis=1)
-            df = df[(df['identifier'] != '') & (df['identifier'] != 'nan')]
-
-            # --- DATE LOGIC FOR FILENAME ---
-            try:
-                if 'date' in df.columns: 
-                    df['date'] = pd.to_datetime(df['date'], utc=True, errors='coerce')
-                    min_date = df['date'].min().strftime('%Y-%m-%d')
-                    max_date = df['date'].max().strftime('%Y-%m-%d')
-                    filename_suffix = f"{min_date} to {max_date}"
-                else:
-                    filename_suffix = "analysis"
-            except:
-                filename_suffix = "analysis"
-
-            if 'customer_id' not in df.columns: df['customer_id'] = None
-            if 'email' not in df.columns: df['email'] = None
-            df['final_cust_id'] = df['customer_id'].fillna(df['email']).fillna('(unknown)')
-
-            order_groups = df.groupby('order_id').agg({
-                'identifier': lambda x: sorted(list(x)),
-                'net_sales': 'sum',
-                'final_cust_id': 'first',
-                'date': 'min'
-            }).reset_index()
-
-            def create_mix_string(items):
-                unique_items = sorted(list(set(items)))
-                return ' + '.join(unique_items)
-
-            order_groups['product_mix'] = order_groups['identifier'].apply(create_mix_string)
-            order_groups = order_groups[order_groups['product_mix'] != '']
-
-            mix_df = order_groups.groupby('product_mix').agg({'order_id': 'count', 'net_sales': 'sum'}).reset_index()
-            mix_df.columns = ['Product mix', 'Orders', 'Net sales']
-            
-            total_orders = mix_df['Orders'].sum()
-            total_net = mix_df['Net sales'].sum()
-            
-            mix_df['% of total'] = mix_df['Orders'] / total_orders
-            mix_df['% of net sales'] = mix_df['Net sales'] / total_net
-            mix_df = mix_df[['Product mix', 'Orders', '% of total', 'Net sales', '% of net sales']]
-            mix_df = mix_df.sort_values('Orders', ascending=False)
-            
-            first_orders = order_groups.sort_values('date').drop_duplicates(subset=['final_cust_id'], keep='first')
-            first_orders_out = first_orders[['final_cust_id', 'order_id', 'date', 'product_mix']].copy()
-            first_orders_out.columns = ['Customer ID', 'First order ID', 'First order date', 'First order product mix']
+            mix_df, first_orders_out, total_orders, total_net, filename_suffix = result
 
             st.success(APP_CONFIG["success_msg"].format(n=total_orders))
             
@@ -390,35 +668,29 @@ if uploaded_file:
             
             tab1, tab2 = st.tabs(["Order product mix", "First order mix"])
             
-            # Header styling for display table
-            header_styles = [
-                {'selector': 'th', 'props': [
-                    ('background-color', '#1A1A1A'), 
-                    ('color', '#F3F3F3'), 
-                    ('font-weight', 'bold')
-                ]}
-            ]
-
+            # Native column formatting: no Styler, so no per-cell Python formatting or HTML
             with tab1:
                 st.dataframe(
-                    mix_df.style.set_table_styles(header_styles).format({
-                        '% of total': '{:.2%}', 
-                        'Net sales': '${:,.2f}', 
-                        '% of net sales': '{:.2%}'
-                    }), 
+                    mix_df, 
                     use_container_width=True, 
-                    hide_index=True
+                    hide_index=True,
+                    column_config={
+                        '% of total': st.column_config.NumberColumn(format='percent'),
+                        'Net sales': st.column_config.NumberColumn(format='dollar'),
+                        '% of net sales': st.column_config.NumberColumn(format='percent')
+                    }
                 )
-                excel_data = convert_to_excel(mix_df, "Order product mix")
+                report_date = pd.Timestamp.now().strftime('%Y-%m-%d')
+                excel_data = convert_to_excel(file_key, settings, "Order product mix", report_date, mix_df)
                 st.download_button("Download Excel report", excel_data, f"Product mix - {filename_suffix}.xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
                 
             with tab2:
                 st.dataframe(
-                    first_orders_out.style.set_table_styles(header_styles), 
+                    first_orders_out, 
                     use_container_width=True, 
                     hide_index=True
                 )
-                excel_data_first = convert_to_excel(first_orders_out, "First order mix")
+                excel_data_first = convert_to_excel(file_key, settings, "First order mix", report_date, first_orders_out)
                 st.download_button("Download Excel report", excel_data_first, f"First order mix - {filename_suffix}.xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
 
         except Exception as e:
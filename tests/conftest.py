@@ -0,0 +1,17 @@
+import os
+import sys
+
+import pytest
+import streamlit as st
+
+# app.py is a script, not a package: import it from the repo root (where style.css lives)
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+
+@pytest.fixture(autouse=True)
+def clear_caches():
+    st.cache_data.clear()
+    yield
+    st.cache_data.clear()
@@ -0,0 +1,49 @@
+import io
+
+import pandas as pd
+import pytest
+
+import app
+
+# Numeric Customer ID with blanks (guest checkouts): one blank falls back to email, one to '(unknown)'
+NUMERIC_CUSTOMERS_CSV = (
+    "Order ID,Customer ID,Customer Email,Created At,Product Title,Net Sales,Financial Status\n"
+    "1001,7001,a@x.com,2024-01-01,Hat,10,paid\n"
+    "1001,7001,a@x.com,2024-01-01,Mug,5,paid\n"
+    "1002,,b@x.com,2024-01-02,Hat,10,paid\n"
+    "1003,,,2024-01-03,Mug,5,paid\n"
+    "1004,7001,a@x.com,2024-01-04,Mug,5,paid\n"
+)
+
+
+def run(file_bytes, file_name):
+    return app.analyze(file_name, file_bytes, file_name, 'Product Name', False, (), (), ())
+
+
+def check_numeric_customers(result, customer_ids):
+    mix_df, first_orders, total_orders, total_net, _ = result
+    assert total_orders == 4
+    assert total_net == 35
+    assert dict(zip(mix_df['Product mix'].astype(str), mix_df['Orders'])) == {'Mug': 2, 'Hat + Mug': 1, 'Hat': 1}
+    assert sorted(first_orders['Customer ID'].astype(str)) == sorted(customer_ids)
+
+
+def test_numeric_customer_ids_with_blanks_csv():
+    check_numeric_customers(run(NUMERIC_CUSTOMERS_CSV.encode(), 'orders.csv'), ['7001', 'b@x.com', '(unknown)'])
+
+
+def test_numeric_customer_ids_with_blanks_excel():
+    pytest.importorskip('python_calamine')
+    buf = io.BytesIO()
+    pd.read_csv(io.StringIO(NUMERIC_CUSTOMERS_CSV)).to_excel(buf, index=False)
+    # Excel cells are floats, so the ID keeps its '.0' as it always has
+    check_numeric_customers(run(buf.getvalue(), 'orders.xlsx'), ['7001.0', 'b@x.com', '(unknown)'])
+
+
+def test_typo_header_is_fuzzy_matched():
+    assert app.map_columns(['Order ID', 'Finantial Status'])['financial_status'] == 'Finantial Status'
+
+
+@pytest.mark.parametrize('header', ['Customers', 'Dates', 'Variants', 'Counts'])
+def test_plural_header_is_not_fuzzy_matched(header):
+    assert header not in app.map_columns(['Order ID', header]).values()
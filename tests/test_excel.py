@@ -0,0 +1,49 @@
+import io
+
+import pandas as pd
+import streamlit as st
+from openpyxl import load_workbook
+
+import app
+
+
+def read_cells(xlsx_bytes):
+    sheet = load_workbook(io.BytesIO(xlsx_bytes)).active
+    return [[(type(c.value), c.value) for c in row] for row in sheet.iter_rows()]
+
+
+def test_fast_writer_matches_openpyxl(monkeypatch):
+    # Shaped like the first-order report: categorical IDs with integer categories, tz-aware dates with a gap
+    df = pd.DataFrame({
+        'Customer ID': pd.Categorical(['7001', 'b@x.com', '(unknown)']),
+        'First order ID': pd.Series([1001, 1002, 1003], dtype='int64[pyarrow]').astype('category'),
+        'First order date': pd.to_datetime(['2024-01-01 10:30', None, '2024-01-03 09:00'], utc=True),
+        'First order product mix': pd.Categorical(['Hat + Mug', 'Hat', 'Mug & <Cup>']),
+        'Net sales': [10.1, float('nan'), 1 / 3],
+        'Orders': [1, 2, 3],
+    })
+    monkeypatch.setattr(app, 'FAST_XLSX_ROWS', len(df))
+    slow = app.convert_to_excel('upload', (), 'First order mix', '2024-01-31', df)
+    st.cache_data.clear()
+    monkeypatch.setattr(app, 'FAST_XLSX_ROWS', 0)
+    fast = app.convert_to_excel('upload', (), 'First order mix', '2024-01-31', df)
+    assert read_cells(fast) == read_cells(slow)
+    assert read_cells(fast)[1][1] == (int, 1001)
+
+
+def test_report_date_is_part_of_the_cache_key():
+    df = pd.DataFrame({'Product mix': ['Hat'], 'Orders': [1]})
+    for day in ('2024-01-31', '2024-02-01'):
+        cells = read_cells(app.convert_to_excel('upload', (), 'Order product mix', day, df))
+        assert cells[1][9] == (str, f'Report: Order product mix | Date: {day}')
+
+
+def test_changed_settings_rebuild_a_large_report():
+    # Above 50k rows Streamlit hashes a frame from a row sample, so a one-row edit must not rely on the frame hash
+    df = pd.DataFrame({'Product mix': [f'Mix {i}' for i in range(60_000)], 'Orders': 1})
+    app.convert_to_excel('upload', ('Product Name',), 'Order product mix', '2024-01-31', df)
+    edited = df.copy()
+    edited.loc[4, 'Product mix'] = 'Edited mix'
+    xlsx = app.convert_to_excel('upload', ('SKU',), 'Order product mix', '2024-01-31', edited)
+    sheet = load_workbook(io.BytesIO(xlsx), read_only=True).active
+    assert next(sheet.iter_rows(min_row=6, max_row=6, max_col=1, values_only=True)) == ('Edited mix',)